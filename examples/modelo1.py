@@ -3,6 +3,12 @@ import sys
 from groq import Groq
 from dotenv import load_dotenv
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, project_root)
+
+from src.voice_input import GroqTranscriber, VoiceSession, transcribe_stream
+
 
 
 load_dotenv()
@@ -98,7 +104,10 @@ def main():
     print(f"Temperatura: {config.temperature}")
     print("\n" + "="*50 + "\n")
 
-    print("Ahora puedes chatear con tu agente. Escribe 'salir' para terminar.\n")
+    print("Ahora puedes chatear con tu agente. Escribe 'salir' para terminar.")
+    print("Para enviar un audio escribe 'voz: ruta/al/audio'.\n")
+
+    transcriber = GroqTranscriber(agent.client)
 
     while True:
         try:
@@ -111,6 +120,23 @@ def main():
                 print("Por favor, escribe algo o 'salir' para terminar.")
                 continue
 
+            if user_input.lower().startswith("voz:"):
+                audio_path = user_input[4:].strip()
+                user_input = ""
+                session = VoiceSession(transcriber)
+                for partial in transcribe_stream(session, audio_path):
+                    user_input = partial
+                    print(f"\rTú (voz): {partial}", end="", flush=True)
+                print()
+
+                if session.error:
+                    print(session.error)
+                    continue
+
+                if not user_input:
+                    print("No se pudo reconocer texto en el audio.")
+                    continue
+
             print("Agente: ", end="", flush=True)
             response = agent.chat(user_input)
             print(response)
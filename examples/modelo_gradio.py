@@ -1,8 +1,24 @@
+import hashlib
 import os
+import sys
 from groq import Groq
 from dotenv import load_dotenv
 import gradio as gr
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, project_root)
+
+from src.agent_core import ConversationAgent
+from src.image_pipeline import (
+    build_user_content,
+    get_pipeline,
+    is_vision_model,
+    prepare_messages,
+    split_user_content,
+)
+from src.voice_input import GroqTranscriber, VoiceSession, segment_from_array
+
 
 load_dotenv()
 
@@ -12,55 +28,74 @@ if not api_key:
     raise ValueError("No se encontró GROQ_API_KEY en el archivo .env")
 
 
-class ChatAgent:
+def image_key(url):
+    """Clave corta para una URL data: de imagen"""
+    return hashlib.sha256(url.encode("ascii")).hexdigest()
+
+
+class ChatAgent(ConversationAgent):
     """Agente de chat"""
     
     def __init__(self, model="llama-3.3-70b-versatile", temperature=0.7, system_prompt=""):
-        self.client = Groq(api_key=api_key)
-        self.model = model
-        self.temperature = temperature
-        self.system_prompt = system_prompt
-        self.reset_conversation()
+        super().__init__(
+            client=Groq(api_key=api_key),
+            model=model,
+            temperature=temperature,
+            system_prompt=system_prompt
+        )
     
     def reset_conversation(self):
         """Reiniciar el historial de conversación"""
-        self.history = []
-        if self.system_prompt:
-            self.history.append({
-                "role": "system",
-                "content": self.system_prompt
-            })
+        super().reset_conversation()
+        # Archivo original de cada imagen enviada (por hash), para mostrarla en el chat
+        self.image_paths = {}
     
-    def chat(self, message):
-        """Enviar mensaje y obtener respuesta"""
-        self.history.append({
-            "role": "user",
-            "content": message
-        })
-        
+    def branch(self):
+        """Crear una rama nueva que comparte el historial actual"""
+        clone = super().branch()
+        clone.image_paths = dict(self.image_paths)
+        return clone
+    
+    def image_path(self, url):
+        """Archivo original de una imagen enviada, si se conoce"""
+        return self.image_paths.get(image_key(url))
+    
+    def chat(self, message, images=None):
+        """Enviar mensaje (con imágenes opcionales) y obtener respuesta"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.history,
-                temperature=self.temperature,
-                max_tokens=8192,
-            )
-            
-            assistant_message = response.choices[0].message.content
-            
-            self.history.append({
-                "role": "assistant",
-                "content": assistant_message
-            })
-            
-            return assistant_message
-        
+            image_urls = get_pipeline().encode_many(images) if images else []
         except Exception as e:
-            return f"Error: {str(e)}"
+            self.last_error = f"Error: no se pudo procesar la imagen ({str(e)})"
+            return self.last_error
+        
+        for url, path in zip(image_urls, images or []):
+            self.image_paths[image_key(url)] = path
+        return super().chat(build_user_content(message, image_urls))
+    
+    def edit(self, turn, message):
+        """Cambiar el texto de un mensaje anterior conservando sus imágenes"""
+        if self.head is not None:
+            _, image_urls = split_user_content(self.head.user_turn(turn).message["content"])
+            message = build_user_content(message, image_urls)
+        return super().edit(turn, message)
+    
+    def _request_messages(self, node):
+        return prepare_messages(
+            node.messages(),
+            keep_last=1 if is_vision_model(self.model) else 0
+        )
 
 
 agent = None
 
+MAX_CANDIDATES = 4
+
+
+def close_voice_session(session):
+    """Liberar el pool de una sesión de voz que ya no se usa"""
+    if session is not None:
+        session.close()
+
 
 def initialize_agent(model, temperature, system_prompt):
     """Inicializar o reinicializar el agente"""
@@ -73,16 +108,56 @@ def initialize_agent(model, temperature, system_prompt):
     return None  
 
 
-def chat_function(message, history):
-    """Función principal de chat para Gradio"""
+def chat_function(message, images=None):
+    """Enviar el mensaje al agente; devuelve un aviso si no se pudo"""
     if agent is None:
         return "Por favor configura el agente primero en la pestaña de Configuración"
     
-    if not message.strip():
-        return ""
+    if images and not is_vision_model(agent.model):
+        return "El modelo seleccionado no acepta imágenes. Elige un modelo de visión en Configuración"
+    
+    agent.chat(message, images=images)
+    return agent.last_error
+
+
+def render_chat():
+    """Construir la conversación del chatbot a partir del historial del agente"""
+    chat_history = []
+    if agent is None:
+        return chat_history
+    
+    for message in agent.history:
+        if message["role"] == "user":
+            text, image_urls = split_user_content(message["content"])
+            for url in image_urls:
+                path = agent.image_path(url)
+                chat_history.append([(path,) if path else "🖼️ Imagen", None])
+            chat_history.append([text or None, None])
+        elif message["role"] == "assistant":
+            chat_history[-1][1] = message["content"]
+    return chat_history
+
+
+def candidate_updates():
+    """Mostrar las últimas respuestas alternativas del agente, si las hay"""
+    candidates = agent.candidates if agent is not None else []
+    if len(candidates) < 2:
+        return [gr.update(visible=False)] * MAX_CANDIDATES + [gr.update(choices=[], value=None, visible=False)]
     
-    response = agent.chat(message)
-    return response
+    shown = list(enumerate(candidates))[-MAX_CANDIDATES:]
+    labels = [f"Opción {i + 1}" for i, _ in shown]
+    views = [
+        gr.update(value=f"**{labels[j]}**\n\n{shown[j][1].message['content']}", visible=True)
+        if j < len(shown) else gr.update(visible=False)
+        for j in range(MAX_CANDIDATES)
+    ]
+    selected = next((label for label, (_, node) in zip(labels, shown) if node is agent.head), None)
+    return views + [gr.update(choices=labels, value=selected, visible=True)]
+
+
+def refresh_chat():
+    """Valores del chatbot y de las respuestas alternativas"""
+    return [render_chat()] + candidate_updates()
 
 
 with gr.Blocks(
@@ -113,8 +188,6 @@ with gr.Blocks(
         
         
         with gr.Tab("Chat", id=0):
-            BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.abspath(os.path.join(BASE_DIR, ".."))
             avatar_path = os.path.join(project_root, "images", "queso.jpg")
 
             chatbot = gr.Chatbot(
@@ -127,9 +200,11 @@ with gr.Blocks(
             )
             
             with gr.Row():
-                msg = gr.Textbox(
+                msg = gr.MultimodalTextbox(
                     label="Tu mensaje",
-                    placeholder="Escribe tu mensaje aquí y presiona Enter...",
+                    placeholder="Escribe tu mensaje aquí, adjunta imágenes y presiona Enter...",
+                    file_types=["image"],
+                    file_count="multiple",
                     lines=2,
                     scale=4,
                     autofocus=True
@@ -139,12 +214,38 @@ with gr.Blocks(
                 send_btn = gr.Button("Enviar", variant="primary", scale=1)
                 clear_btn = gr.Button("Limpiar", variant="secondary", scale=1)
             
+            with gr.Row():
+                regenerate_btn = gr.Button("🔄 Regenerar", variant="secondary", scale=1)
+                edit_btn = gr.Button("✏️ Editar último mensaje", variant="secondary", scale=1)
+                num_candidates = gr.Slider(
+                    minimum=1,
+                    maximum=MAX_CANDIDATES,
+                    value=1,
+                    step=1,
+                    label="Respuestas alternativas",
+                    scale=2
+                )
+            
+            with gr.Row():
+                candidate_views = [
+                    gr.Markdown(visible=False) for _ in range(MAX_CANDIDATES)
+                ]
+            candidate_choice = gr.Radio(label="Elige la respuesta", choices=[], visible=False)
+            
+            voice_input = gr.Audio(
+                sources=["microphone"],
+                type="numpy",
+                streaming=True,
+                label="🎤 Mensaje de voz"
+            )
+            voice_session = gr.State(None, delete_callback=close_voice_session)
+            
             gr.Examples(
                 examples=[
-                    "Hola, ¿cómo estás?",
-                    "Explícame qué es la inteligencia artificial",
-                    "Dame 3 consejos para ser más productivo",
-                    "Escribe un poema corto sobre la tecnología",
+                    {"text": "Hola, ¿cómo estás?"},
+                    {"text": "Explícame qué es la inteligencia artificial"},
+                    {"text": "Dame 3 consejos para ser más productivo"},
+                    {"text": "Escribe un poema corto sobre la tecnología"},
                 ],
                 inputs=msg,
                 label="Ejemplos de preguntas"
@@ -160,7 +261,8 @@ with gr.Blocks(
                     "llama-3.1-70b-versatile", 
                     "llama-3.1-8b-instant",
                     "mixtral-8x7b-32768",
-                    "gemma2-9b-it"
+                    "gemma2-9b-it",
+                    "meta-llama/llama-4-scout-17b-16e-instruct"
                 ],
                 value="llama-3.3-70b-versatile",
                 label="Modelo de IA",
@@ -199,6 +301,7 @@ with gr.Blocks(
                     | **llama-3.1-8b-instant** | Rápido y eficiente | 🟢🟢 Rápida | 8K |
                     | **mixtral-8x7b-32768** | Excelente para contextos largos | 🟢 Media | 32K |
                     | **gemma2-9b-it** | Modelo compacto de Google | 🟢🟢 Rápida | 8K |
+                    | **llama-4-scout-17b-16e-instruct** | Acepta imágenes (visión) | 🟢🟢 Rápida | 128K |
                     """
                 )
         
@@ -241,39 +344,126 @@ with gr.Blocks(
                 """
             )
     
-    def respond(message, chat_history):
+    def respond(message):
         """Manejar respuesta del bot"""
-        if not message.strip():
-            return "", chat_history
+        text = message.get("text", "") or ""
+        images = message.get("files", []) or []
+        if not text.strip() and not images:
+            return [message] + refresh_chat()
+        
+        warning = chat_function(text, images=images)
+        if warning:
+            gr.Warning(warning)
+            return [message] + refresh_chat()
+        return [None] + refresh_chat()
+    
+    def regenerate(n):
+        """Regenerar la última respuesta, con varias candidatas en paralelo"""
+        if agent is None:
+            gr.Warning("Por favor configura el agente primero en la pestaña de Configuración")
+            return refresh_chat()
         
-        bot_message = chat_function(message, chat_history)
-        chat_history.append((message, bot_message))
-        return "", chat_history
+        agent.regenerate(int(n))
+        if agent.last_error:
+            gr.Warning(agent.last_error)
+        return refresh_chat()
+    
+    def select_candidate(choice):
+        """Usar la respuesta candidata elegida"""
+        if agent is not None and choice:
+            index = int(choice.split()[-1]) - 1
+            if index < len(agent.candidates):
+                agent.select(index)
+        return refresh_chat()
+    
+    def edit_last(message):
+        """Reemplazar el último mensaje del usuario con el texto escrito"""
+        text = (message or {}).get("text", "") or ""
+        if agent is None or not text.strip():
+            gr.Warning("Escribe en la caja de mensaje el nuevo texto del último mensaje")
+            return [message] + refresh_chat()
+        
+        try:
+            agent.edit(-1, text)
+        except IndexError:
+            gr.Warning("No hay ningún mensaje para editar")
+            return [message] + refresh_chat()
+        
+        if agent.last_error:
+            gr.Warning(agent.last_error)
+            return [message] + refresh_chat()
+        return [None] + refresh_chat()
+    
+    def start_voice(session):
+        """Iniciar una sesión de transcripción al empezar a grabar"""
+        close_voice_session(session)
+        if agent is None:
+            return None
+        return VoiceSession(GroqTranscriber(agent.client))
+    
+    def stream_voice(chunk, session):
+        """Transcribir el audio por fragmentos mientras se graba"""
+        if session is None or chunk is None:
+            return session, gr.update()
+        
+        sample_rate, samples = chunk
+        session.feed(segment_from_array(sample_rate, samples))
+        return session, {"text": session.partial_text(), "files": []}
+    
+    def stop_voice(session):
+        """Terminar la transcripción y enviar el mensaje"""
+        if session is None:
+            return [None, gr.update()] + refresh_chat()
+        
+        text = session.finish()
+        if session.error:
+            gr.Warning(session.error)
+            return [None, {"text": text, "files": []}] + refresh_chat()
+        
+        return [None] + respond({"text": text, "files": []})
     
     def clear_chat():
         """Limpiar el chat y reiniciar el agente"""
         if agent:
             agent.reset_conversation()
-        return None
+        return refresh_chat()
     
     def apply_config(model, temperature, system_prompt):
         """Aplicar configuración y reiniciar agente"""
         initialize_agent(model, temperature, system_prompt)
-        return f"Configuración aplicada correctamente!\n\n**Modelo**: {model}\n**Temperatura**: {temperature}"
+        status = f"Configuración aplicada correctamente!\n\n**Modelo**: {model}\n**Temperatura**: {temperature}"
+        return [status] + refresh_chat()
     
-    msg.submit(respond, [msg, chatbot], [msg, chatbot])
-    send_btn.click(respond, [msg, chatbot], [msg, chatbot])
-    clear_btn.click(clear_chat, None, chatbot)
+    chat_outputs = [chatbot] + candidate_views + [candidate_choice]
+    
+    msg.submit(respond, msg, [msg] + chat_outputs)
+    send_btn.click(respond, msg, [msg] + chat_outputs)
+    clear_btn.click(clear_chat, None, chat_outputs)
+    regenerate_btn.click(regenerate, num_candidates, chat_outputs)
+    candidate_choice.input(select_candidate, candidate_choice, chat_outputs)
+    edit_btn.click(edit_last, msg, [msg] + chat_outputs)
+    voice_input.start_recording(start_voice, voice_session, voice_session)
+    voice_input.stream(
+        stream_voice,
+        [voice_input, voice_session],
+        [voice_session, msg],
+        stream_every=1.0
+    )
+    voice_input.stop_recording(
+        stop_voice,
+        voice_session,
+        [voice_session, msg] + chat_outputs
+    )
     apply_btn.click(
         apply_config,
         [model_dropdown, temperature_slider, system_prompt_textbox],
-        config_status
+        [config_status] + chat_outputs
     )
     
     demo.load(
         apply_config,
         [model_dropdown, temperature_slider, system_prompt_textbox],
-        config_status
+        [config_status] + chat_outputs
     )
 
 
@@ -283,7 +473,7 @@ if __name__ == "__main__":
     print("="*70)
     print("\n✓ Interfaz: Gradio")
     print("✓ API Encontrada")
-    print("✓ Modelos disponibles: 5")
+    print("✓ Modelos disponibles: 6")
     print("\nLa interfaz se abrirá automáticamente en tu navegador")
     print("URL local: http://127.0.0.1:7860")
     print("Presiona Ctrl+C para detener\n")
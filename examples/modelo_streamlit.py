@@ -1,52 +1,80 @@
 import os
+import sys
 from groq import Groq
 from dotenv import load_dotenv
 import streamlit as st
 from datetime import datetime
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, project_root)
+
+from src.agent_core import ConversationAgent
+from src.image_pipeline import (
+    build_user_content,
+    decode_data_url,
+    get_pipeline,
+    is_vision_model,
+    prepare_messages,
+    split_user_content,
+)
+from src.voice_input import GroqTranscriber, VoiceSession, transcribe_stream
+
 load_dotenv()
 
 api_key = os.getenv("GROQ_API_KEY")
 
-class ChatAgent:
+class ChatAgent(ConversationAgent):
     
     def __init__(self, model, temperature, system_prompt):
-        self.client = Groq(api_key=api_key)
-        self.model = model
-        self.temperature = temperature
-        self.system_prompt = system_prompt
-        self.history = []
-        if system_prompt:
-            self.history.append({
-                "role": "system",
-                "content": system_prompt
-            })
+        super().__init__(
+            client=Groq(api_key=api_key),
+            model=model,
+            temperature=temperature,
+            system_prompt=system_prompt
+        )
     
-    def chat(self, message):
-        self.history.append({
-            "role": "user",
-            "content": message
-        })
-        
+    def chat(self, message, images=None):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.history,
-                temperature=self.temperature,
-                max_tokens=8192,
-            )
-            
-            assistant_message = response.choices[0].message.content
-            
-            self.history.append({
-                "role": "assistant",
-                "content": assistant_message
-            })
-            
-            return assistant_message
-        
+            image_urls = get_pipeline().encode_many(images) if images else []
         except Exception as e:
-            return f"Error: {str(e)}"
+            self.last_error = f"Error: no se pudo procesar la imagen ({str(e)})"
+            return self.last_error
+        
+        return super().chat(build_user_content(message, image_urls))
+    
+    def edit(self, turn, message):
+        if self.head is not None:
+            _, image_urls = split_user_content(self.head.user_turn(turn).message["content"])
+            message = build_user_content(message, image_urls)
+        return super().edit(turn, message)
+    
+    def _request_messages(self, node):
+        return prepare_messages(
+            node.messages(),
+            keep_last=1 if is_vision_model(self.model) else 0
+        )
+
+
+def show_content(content):
+    """Mostrar el texto y las imágenes de un mensaje"""
+    text, image_urls = split_user_content(content)
+    for url in image_urls:
+        st.image(decode_data_url(url), width=300)
+    if text:
+        st.markdown(text)
+
+
+def reply(prompt, images=None):
+    """Pedir la respuesta al agente y mostrarla; los errores no entran al historial"""
+    agent = st.session_state.agent
+    with st.chat_message("assistant", avatar="🤖"):
+        with st.spinner("Pensando..."):
+            response = agent.chat(prompt, images=images)
+        if agent.last_error:
+            st.error(response)
+        else:
+            st.markdown(response)
 
 
 st.set_page_config(
@@ -127,8 +155,6 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.abspath(os.path.join(BASE_DIR, ".."))
 avatar_path = os.path.join(project_root, "images", "queso.jpg")
 with st.sidebar:
     st.image(avatar_path, width=200)
@@ -142,7 +168,8 @@ with st.sidebar:
         "llama-3.1-70b-versatile": " LLaMA 3.1 70B - Muy capaz", 
         "llama-3.1-8b-instant": " LLaMA 3.1 8B - Ultra rápido",
         "mixtral-8x7b-32768": " Mixtral 8x7B - Contexto largo",
-        "gemma2-9b-it": " Gemma2 9B - Compacto"
+        "gemma2-9b-it": " Gemma2 9B - Compacto",
+        "meta-llama/llama-4-scout-17b-16e-instruct": " LLaMA 4 Scout - Acepta imágenes"
     }
     
     selected_model = st.selectbox(
@@ -171,6 +198,16 @@ with st.sidebar:
             help="Este mensaje define cómo se comportará el agente"
         )
     
+    voice = st.audio_input("🎤 Mensaje de voz", key="voice_input")
+    
+    num_candidates = st.number_input(
+        "Respuestas alternativas al regenerar",
+        min_value=1,
+        max_value=4,
+        value=1,
+        help="Se generan en paralelo para compararlas lado a lado"
+    )
+    
     st.divider()
     
   
@@ -178,8 +215,8 @@ with st.sidebar:
     
     with col1:
         if st.button("🔄 Reiniciar", use_container_width=True, type="secondary"):
-            st.session_state.messages = []
-            st.session_state.agent = None
+            if st.session_state.get("agent") is not None:
+                st.session_state.agent.reset_conversation()
             st.rerun()
     
     with col2:
@@ -196,7 +233,11 @@ with st.sidebar:
     
     st.subheader("Estadísticas")
     
-    num_messages = len(st.session_state.get("messages", []))
+    current_agent = st.session_state.get("agent")
+    num_messages = len([
+        message for message in (current_agent.history if current_agent else [])
+        if message["role"] != "system"
+    ])
     
     col1, col2 = st.columns(2)
     with col1:
@@ -225,9 +266,6 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"Sesión iniciada: {datetime.now().strftime('%H:%M:%S')}")
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
 if "agent" not in st.session_state:
     st.session_state.agent = ChatAgent(
         model=selected_model,
@@ -240,25 +278,87 @@ if "config_applied" not in st.session_state:
 
 chat_container = st.container()
 
+agent = st.session_state.agent
+
 with chat_container:
-    for message in st.session_state.messages:
+    for message in agent.history:
+        if message["role"] == "system":
+            continue
         with st.chat_message(message["role"], avatar="🧑" if message["role"] == "user" else "🤖"):
-            st.markdown(message["content"])
+            show_content(message["content"])
     
-    if prompt := st.chat_input("💬 Escribe tu mensaje aquí...", key="chat_input"):
+    if submission := st.chat_input(
+        "💬 Escribe tu mensaje aquí...",
+        key="chat_input",
+        accept_file="multiple",
+        file_type=["png", "jpg", "jpeg", "webp", "gif"]
+    ):
+        prompt = submission.text or ""
+        images = [file.getvalue() for file in submission.files]
         
-        st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user", avatar="🧑"):
+            for image in images:
+                st.image(image, width=300)
             st.markdown(prompt)
         
-        with st.chat_message("assistant", avatar="🤖"):
+        if images and not is_vision_model(agent.model):
+            st.warning("El modelo seleccionado no acepta imágenes. Elige un modelo de visión en la barra lateral")
+        else:
+            reply(prompt, images=images)
+    
+    if voice is not None and voice.file_id != st.session_state.get("last_voice_id"):
+        prompt = ""
+        session = VoiceSession(GroqTranscriber(agent.client))
+        with st.chat_message("user", avatar="🧑"):
+            transcript = st.empty()
+            for prompt in transcribe_stream(session, voice, format="wav"):
+                transcript.markdown(prompt)
+        
+        if session.error:
+            st.error(session.error)
+        elif prompt:
+            st.session_state.last_voice_id = voice.file_id
+            reply(prompt)
+        else:
+            st.session_state.last_voice_id = voice.file_id
+            st.warning("No se pudo reconocer texto en el audio.")
+    
+    history = agent.history
+    if history and history[-1]["role"] == "assistant":
+        if len(agent.candidates) > 1:
+            shown = list(enumerate(agent.candidates))[-4:]
+            columns = st.columns(len(shown))
+            for col, (i, node) in zip(columns, shown):
+                with col:
+                    current = node is agent.head
+                    st.markdown(f"**Opción {i + 1}**" + (" ✅" if current else ""))
+                    st.markdown(node.message["content"])
+                    if st.button("Usar esta", key=f"candidate_{i}", use_container_width=True, disabled=current):
+                        agent.select(i)
+                        st.rerun()
+        
+        if st.button("🔄 Regenerar respuesta", type="secondary"):
             with st.spinner("Pensando..."):
-                response = st.session_state.agent.chat(prompt)
-                st.markdown(response)
+                agent.regenerate(int(num_candidates))
+            if agent.last_error:
+                st.error(agent.last_error)
+            else:
+                st.rerun()
         
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        with st.expander("✏️ Editar último mensaje", expanded=False):
+            edited = st.text_area(
+                "Nuevo mensaje",
+                value=split_user_content(history[-2]["content"])[0]
+            )
+            if st.button("Reenviar", type="primary") and edited.strip():
+                with st.spinner("Pensando..."):
+                    agent.edit(-1, edited)
+                if agent.last_error:
+                    st.error(agent.last_error)
+                else:
+                    st.rerun()
 
-if len(st.session_state.messages) == 0:
+if not any(message["role"] != "system" for message in agent.history):
     st.markdown("### 💡 Ejemplos de preguntas:")
     
     col1, col2, col3 = st.columns(3)
@@ -272,10 +372,11 @@ if len(st.session_state.messages) == 0:
     for col, question in zip([col1, col2, col3], example_questions):
         with col:
             if st.button(question, use_container_width=True, key=f"example_{question[:10]}"):
-                st.session_state.messages.append({"role": "user", "content": question})
-                response = st.session_state.agent.chat(question)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                st.rerun()
+                agent.chat(question)
+                if agent.last_error:
+                    st.error(agent.last_error)
+                else:
+                    st.rerun()
 
 st.divider()
 col1, col2, col3 = st.columns([2, 1, 2])
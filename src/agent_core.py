@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HistoryNode:
+    """Mensaje inmutable del historial enlazado con su mensaje anterior
+
+    Cada nodo apunta a su padre, así que varias ramas comparten el mismo
+    prefijo de conversación sin copiarlo: crear una rama o agregar un
+    mensaje cuesta O(1).
+    """
+
+    __slots__ = ("message", "parent", "depth")
+
+    def __init__(self, message, parent=None):
+        self.message = message
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+    def append(self, message):
+        """Crear un nodo hijo sin modificar este"""
+        return HistoryNode(message, self)
+
+    def messages(self):
+        """Lista de mensajes desde la raíz hasta este nodo"""
+        result = [None] * self.depth
+        node = self
+        for i in range(self.depth - 1, -1, -1):
+            result[i] = node.message
+            node = node.parent
+        return result
+
+    def user_turn(self, turn):
+        """Nodo del mensaje de usuario número `turn` (empezando en 0, o negativo desde el final)"""
+        user_nodes = []
+        node = self
+        while node is not None:
+            if node.message["role"] == "user":
+                user_nodes.append(node)
+            node = node.parent
+        user_nodes.reverse()
+
+        if not -len(user_nodes) <= turn < len(user_nodes):
+            raise IndexError(f"No existe el turno {turn} en la conversación")
+        return user_nodes[turn]
+
+
+class ConversationAgent:
+    """Agente de chat con historial ramificable
+
+    Permite regenerar la última respuesta (varias candidatas en paralelo),
+    editar un mensaje anterior y crear ramas que comparten el historial.
+    Si una operación falla, la rama actual no cambia y el mensaje de error
+    queda en `last_error`.
+    """
+
+    def __init__(self, client, model, temperature, system_prompt="", max_tokens=8192, max_workers=4):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.max_workers = max_workers
+        self.reset_conversation()
+
+    def reset_conversation(self):
+        """Reiniciar el historial de conversación"""
+        self.head = None
+        if self.system_prompt:
+            self.head = HistoryNode({"role": "system", "content": self.system_prompt})
+        self.candidates = []
+        self.last_error = None
+
+    @property
+    def history(self):
+        """Historial de la rama actual como lista de mensajes"""
+        return self.head.messages() if self.head is not None else []
+
+    def chat(self, message):
+        """Enviar mensaje y obtener respuesta"""
+        return self._send(self.head, message)
+
+    def _send(self, base, message):
+        """Responder `message` como hijo de `base`; la rama solo cambia si hay éxito"""
+        self.last_error = None
+        user_node = self._append(base, {"role": "user", "content": message})
+
+        try:
+            assistant_message = self._complete(user_node)
+        except Exception as e:
+            self.last_error = f"Error: {str(e)}"
+            return self.last_error
+
+        self.head = user_node.append({"role": "assistant", "content": assistant_message})
+        self.candidates = []
+        return assistant_message
+
+    def regenerate(self, n=1):
+        """Generar `n` respuestas nuevas para el último mensaje del usuario
+
+        Las candidatas se piden en paralelo y comparten el historial anterior.
+        La primera nueva queda seleccionada; las anteriores de este mismo
+        mensaje (incluida la respuesta que se mostraba) siguen en
+        `candidates` y se pueden elegir con `select`.
+        """
+        self.last_error = None
+        user_node = self.head
+        while user_node is not None and user_node.message["role"] != "user":
+            user_node = user_node.parent
+        if user_node is None:
+            self.last_error = "No hay ningún mensaje para regenerar"
+            return [self.last_error]
+
+        n = max(1, n)
+        with ThreadPoolExecutor(max_workers=min(n, self.max_workers)) as executor:
+            futures = [executor.submit(self._complete, user_node) for _ in range(n)]
+
+        candidates = []
+        errors = []
+        for future in futures:
+            try:
+                content = future.result()
+            except Exception as e:
+                errors.append(f"Error: {str(e)}")
+                continue
+            candidates.append(user_node.append({"role": "assistant", "content": content}))
+
+        if not candidates:
+            self.last_error = errors[0]
+            return errors[:1]
+
+        previous = [node for node in self.candidates if node.parent is user_node]
+        if self.head.parent is user_node and self.head not in previous:
+            previous.append(self.head)
+
+        self.candidates = previous + candidates
+        self.head = candidates[0]
+        return [node.message["content"] for node in candidates]
+
+    def select(self, index):
+        """Elegir una de las respuestas candidatas de `regenerate`"""
+        self.head = self.candidates[index]
+        return self.head.message["content"]
+
+    def edit(self, turn, message):
+        """Reemplazar el mensaje de usuario número `turn` y continuar desde ahí"""
+        if self.head is None:
+            raise IndexError(f"No existe el turno {turn} en la conversación")
+        return self._send(self.head.user_turn(turn).parent, message)
+
+    def branch(self):
+        """Crear una rama nueva que comparte el historial actual"""
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.candidates = list(self.candidates)
+        return clone
+
+    def _append(self, node, message):
+        if node is None:
+            return HistoryNode(message)
+        return node.append(message)
+
+    def _request_messages(self, node):
+        """Mensajes que se envían a la API para la rama que termina en `node`"""
+        return node.messages()
+
+    def _complete(self, node):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._request_messages(node),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+        )
+        return response.choices[0].message.content
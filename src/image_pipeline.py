@@ -0,0 +1,196 @@
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+
+# Modelos de Groq que aceptan imágenes en los mensajes
+VISION_MODELS = {
+    "meta-llama/llama-4-scout-17b-16e-instruct",
+    "meta-llama/llama-4-maverick-17b-128e-instruct",
+}
+
+# Texto que reemplaza las imágenes de turnos antiguos al llamar a la API
+IMAGE_PLACEHOLDER = "[imagen enviada anteriormente]"
+
+
+def is_vision_model(model):
+    """Indica si el modelo acepta imágenes"""
+    return model in VISION_MODELS
+
+
+class ImagePipeline:
+    """Reduce, recodifica y cachea imágenes para modelos de visión"""
+
+    def __init__(self, max_size=1024, quality=85, max_workers=4, cache_size=64):
+        self.max_size = max_size
+        self.quality = quality
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="image-pipeline"
+        )
+
+    def encode(self, source):
+        """Convertir una imagen (ruta o bytes) en una URL data: base64"""
+        return self.encode_many([source])[0]
+
+    def encode_many(self, sources):
+        """Convertir varias imágenes en paralelo, reutilizando la caché"""
+        raw_images = [self._read(source) for source in sources]
+        keys = [self._key(raw) for raw in raw_images]
+
+        results = {}
+        pending = {}
+        for key, raw in zip(keys, raw_images):
+            if key in results or key in pending:
+                continue
+            cached = self._get_cached(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = self._executor.submit(self._encode_bytes, raw)
+
+        for key, future in pending.items():
+            results[key] = future.result()
+            self._store(key, results[key])
+
+        return [results[key] for key in keys]
+
+    def shutdown(self):
+        """Detener el pool de trabajadores"""
+        self._executor.shutdown(wait=True)
+
+    def _read(self, source):
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source)
+        if hasattr(source, "getvalue"):
+            return source.getvalue()
+        with open(source, "rb") as f:
+            return f.read()
+
+    def _key(self, raw):
+        digest = hashlib.sha256(raw).hexdigest()
+        return f"{digest}:{self.max_size}:{self.quality}"
+
+    def _get_cached(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _encode_bytes(self, raw):
+        with Image.open(io.BytesIO(raw)) as image:
+            if image.format == "JPEG":
+                # Decodificar el JPEG ya reducido en vez de a resolución completa
+                image.draft("RGB", (self.max_size, self.max_size))
+            image = ImageOps.exif_transpose(image)
+
+            # Las paletas y las imágenes de 1 bit solo se reducen con NEAREST
+            if image.mode in ("P", "PA", "1") or "transparency" in image.info:
+                image = image.convert("RGBA")
+            image.thumbnail((self.max_size, self.max_size), Image.LANCZOS)
+            image = self._to_rgb(image)
+
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+
+        encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+        return f"data:image/jpeg;base64,{encoded}"
+
+    def _to_rgb(self, image):
+        # JPEG no tiene transparencia: pegar sobre fondo blanco y no negro
+        if image.mode in ("RGBA", "LA"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image.convert("RGBA"), mask=image.getchannel("A"))
+            return background
+        if image.mode != "RGB":
+            return image.convert("RGB")
+        return image
+
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Obtener el pipeline compartido por toda la aplicación"""
+    global _default_pipeline
+    with _default_lock:
+        if _default_pipeline is None:
+            _default_pipeline = ImagePipeline()
+        return _default_pipeline
+
+
+def build_user_content(text, image_urls):
+    """Construir el contenido multimodal de un mensaje de usuario"""
+    if not image_urls:
+        return text
+
+    content = []
+    if text:
+        content.append({"type": "text", "text": text})
+    for url in image_urls:
+        content.append({"type": "image_url", "image_url": {"url": url}})
+    return content
+
+
+def split_user_content(content):
+    """Separar el texto y las URLs de imagen de un mensaje de usuario"""
+    if not isinstance(content, list):
+        return content, []
+
+    texts = [part["text"] for part in content if part.get("type") == "text"]
+    image_urls = [
+        part["image_url"]["url"] for part in content
+        if part.get("type") == "image_url"
+    ]
+    return "\n".join(texts), image_urls
+
+
+def decode_data_url(url):
+    """Obtener los bytes de una URL data: base64"""
+    return base64.b64decode(url.split(",", 1)[1])
+
+
+def prepare_messages(history, keep_last=1):
+    """Preparar el historial para la API enviando solo las imágenes recientes
+
+    Las imágenes de turnos anteriores a los últimos `keep_last` mensajes con
+    imágenes se reemplazan por un texto corto, para no volver a subir el
+    base64 en cada turno.
+    """
+    image_turns = [
+        i for i, message in enumerate(history)
+        if isinstance(message.get("content"), list)
+    ]
+    keep = set(image_turns[-keep_last:]) if keep_last > 0 else set()
+
+    messages = []
+    for i, message in enumerate(history):
+        content = message.get("content")
+        if not isinstance(content, list) or i in keep:
+            messages.append(message)
+            continue
+
+        parts = [
+            part["text"] if part.get("type") == "text" else IMAGE_PLACEHOLDER
+            for part in content
+        ]
+        messages.append({**message, "content": "\n".join(parts)})
+
+    return messages
@@ -0,0 +1,224 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent, detect_silence
+
+
+# Whisper trabaja a 16 kHz mono; enviar más no mejora la transcripción
+SAMPLE_RATE = 16000
+
+# Por debajo de este nivel (dBFS) el audio se considera silencio aunque todo sea bajo
+SILENCE_FLOOR = -60
+
+
+class GroqTranscriber:
+    """Transcribe fragmentos de audio con el endpoint Whisper de Groq"""
+
+    def __init__(self, client, model="whisper-large-v3-turbo", language="es"):
+        self.client = client
+        self.model = model
+        self.language = language
+
+    def __call__(self, audio_bytes):
+        transcription = self.client.audio.transcriptions.create(
+            file=("fragmento.wav", audio_bytes),
+            model=self.model,
+            language=self.language,
+            response_format="text",
+        )
+        if isinstance(transcription, str):
+            return transcription.strip()
+        return transcription.text.strip()
+
+
+def load_audio(source, format=None):
+    """Cargar audio desde una ruta, bytes o archivo subido
+
+    Con `format="wav"` (o una ruta .wav) pydub lee el audio directamente;
+    cualquier otro formato necesita ffmpeg instalado en el sistema.
+    """
+    if isinstance(source, AudioSegment):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return AudioSegment.from_file(io.BytesIO(source), format=format)
+    if hasattr(source, "getvalue"):
+        return AudioSegment.from_file(io.BytesIO(source.getvalue()), format=format)
+    return AudioSegment.from_file(source, format=format)
+
+
+def segment_from_array(sample_rate, samples):
+    """Convertir un arreglo numpy (como lo entrega Gradio) en AudioSegment"""
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    return AudioSegment(
+        data=samples.tobytes(),
+        sample_width=samples.dtype.itemsize,
+        frame_rate=sample_rate,
+        channels=channels,
+    )
+
+
+def to_wav_bytes(segment):
+    """Exportar un fragmento como WAV mono de 16 kHz"""
+    buffer = io.BytesIO()
+    segment.set_channels(1).set_frame_rate(SAMPLE_RATE).export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+class VoiceSession:
+    """Transcribe audio por fragmentos mientras el usuario sigue hablando
+
+    El audio se corta en el silencio más cercano a cada `chunk_ms` (buscando
+    solo en los siguientes `2 * chunk_ms`), para no partir palabras, y cada
+    fragmento se transcribe en un pool de hilos. El silencio se mide
+    `silence_offset` dB por debajo del volumen del propio audio.
+    `partial_text()` devuelve en orden lo que ya está transcrito y `finish()`
+    espera solo los fragmentos que faltan. Si algún fragmento falla, el error
+    queda en `self.error` y la sesión no lanza excepciones.
+    """
+
+    def __init__(self, transcriber, chunk_ms=5000, max_workers=4,
+                 min_chunk_ms=500, min_silence_ms=300, silence_offset=16):
+        self.transcriber = transcriber
+        self.chunk_ms = chunk_ms
+        self.min_chunk_ms = min_chunk_ms
+        self.min_silence_ms = min_silence_ms
+        self.silence_offset = silence_offset
+        self.error = None
+        self._buffer = AudioSegment.empty()
+        self._futures = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="voice-input"
+        )
+
+    def feed(self, segment):
+        """Agregar audio nuevo y lanzar los fragmentos completos
+
+        No hace nada si la sesión ya terminó.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer += segment
+
+            # Avanzar con un desplazamiento y recortar el búfer una sola vez
+            start = 0
+            while len(self._buffer) - start >= self.chunk_ms:
+                window = self._buffer[start:start + 2 * self.chunk_ms]
+                cut = self._split_point(window)
+                if cut is None:
+                    break
+                self._submit(window[:cut])
+                start += cut
+
+            if start:
+                self._buffer = self._buffer[start:]
+
+    def partial_text(self):
+        """Texto transcrito hasta el primer fragmento pendiente"""
+        with self._lock:
+            futures = list(self._futures)
+
+        parts = []
+        for future in futures:
+            if not future.done() or future.cancelled():
+                break
+            parts.append(future.result())
+        return _join(parts)
+
+    def flush(self):
+        """Enviar el audio restante y cerrar la sesión a audio nuevo"""
+        with self._lock:
+            if not self._closed:
+                self._submit(self._buffer)
+                self._buffer = AudioSegment.empty()
+                self._closed = True
+
+    def iter_partials(self):
+        """Generar la transcripción acumulada a medida que llegan fragmentos"""
+        self.flush()
+        with self._lock:
+            futures = list(self._futures)
+
+        try:
+            parts = []
+            for future in futures:
+                parts.append(future.result())
+                yield _join(parts)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def finish(self):
+        """Enviar el audio restante y devolver la transcripción completa"""
+        text = ""
+        for text in self.iter_partials():
+            pass
+        return text
+
+    def close(self):
+        """Descartar la sesión sin esperar los fragmentos pendientes"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _split_point(self, window):
+        silences = detect_silence(
+            window,
+            min_silence_len=self.min_silence_ms,
+            silence_thresh=self._silence_thresh(window),
+            seek_step=10,
+        )
+        cuts = [
+            (start + end) // 2 for start, end in silences
+            if (start + end) // 2 >= self.min_chunk_ms
+        ]
+        if cuts:
+            return min(cuts, key=lambda cut: abs(cut - self.chunk_ms))
+        # Sin pausas en el doble del fragmento: cortar igual para no atrasarse
+        if len(window) >= 2 * self.chunk_ms:
+            return self.chunk_ms
+        return None
+
+    def _silence_thresh(self, audio):
+        return max(audio.dBFS - self.silence_offset, SILENCE_FLOOR)
+
+    def _submit(self, chunk):
+        if len(chunk) == 0:
+            return
+        self._futures.append(self._executor.submit(self._transcribe, chunk))
+
+    def _transcribe(self, chunk):
+        # Whisper tiende a inventar texto en fragmentos silenciosos; los
+        # fragmentos cortos (como la última palabra) sí se envían si tienen voz
+        if not detect_nonsilent(
+            chunk,
+            min_silence_len=min(self.min_silence_ms, len(chunk)),
+            silence_thresh=self._silence_thresh(chunk),
+            seek_step=10,
+        ):
+            return ""
+        try:
+            return self.transcriber(to_wav_bytes(chunk))
+        except Exception as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = f"Error al transcribir el audio: {str(e)}"
+            return ""
+
+
+def transcribe_stream(session, source, format=None):
+    """Transcribir un audio completo en paralelo, entregando parciales
+
+    El último valor generado es el texto completo; si algún fragmento
+    falla, el error queda en `session.error`.
+    """
+    session.feed(load_audio(source, format=format))
+    yield from session.iter_partials()
+
+
+def _join(parts):
+    return " ".join(part for part in parts if part)